@@ -5,22 +5,29 @@ All Rights Reserved.
 NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
 with the terms of the Adobe license agreement accompanying it.
 """
+import functools
 import re
 
 from typing import Iterable, Optional, Tuple, Union
 
 
-# group 0 - entire string
-# group 1 - empty space before template. this helps us ensure we add space to a template but only 1
-# group 2 - template keyword
-# group 3 - table_name
-# group 4 - column_name
-# group 5 - empty space after template. this helps us ensure we add space to a template after but
-#   only 1
+# Patterns used on the query path are compiled once at module load and always invoked
+# as bound methods on the compiled pattern (e.g. LIST_TEMPLATE_REGEX.sub(...)) rather
+# than through the re module functions, which would redo the pattern cache lookup on
+# every call.
+
+# group 1 - template keyword
+# group 2 - table_name (including the trailing dot)
+# group 3 - column_name
+# Any space around the template is matched but not captured since templates add their
+# own padding when they are expanded.
 LIST_TEMPLATE_REGEX = re.compile(
-    r"(( +)?{(in|not_in|values)__([A-Za-z_]+\.)?([A-Za-z_]+)}( +)?)"
+    r" *{(in|not_in|values)__([A-Za-z_]+\.)?([A-Za-z_]+)} *"
 )
 
+# characters stripped out of multi-column keys such as "(column_a, column_b)"
+MULTI_COLUMN_KEY_REGEX = re.compile(r"[, ()]")
+
 
 class TemplateGenerators:
     """
@@ -30,13 +37,7 @@ class TemplateGenerators:
 
     @classmethod
     def get_template(cls, name: str):
-        if name == "in":
-            return cls.in_column
-        if name == "not_in":
-            return cls.not_in_column
-        if name == "values":
-            return cls.values
-        return None
+        return _TEMPLATE_DISPATCH.get(name)
 
     @staticmethod
     def in_column(
@@ -127,25 +128,20 @@ class TemplateGenerators:
         if legacy_key:
             key_name = legacy_key
         if is_multi_column:
-            key_name = re.sub("[, ()]", "", key_name)
+            key_name = MULTI_COLUMN_KEY_REGEX.sub("", key_name)
         return key_name
 
     @staticmethod
     def _parameterize_inner_list(
         key: str, values: Union[str, Iterable[str]]
     ) -> Tuple[str, Optional[dict]]:
-        param_values = {}
-        parameterized_keys = []
         if not isinstance(values, (list, tuple)):
-            param_values[key] = values
-            parameterized_keys.append(key)
-        else:
-            for index, value in enumerate(values):
-                parameterized_key = f"{key.replace('.', '_')}_{str(index)}"
-                param_values[parameterized_key] = value
-                parameterized_keys.append(parameterized_key)
+            return f"( :{key} )", {key: values}
 
-        return f"( :{', :'.join(parameterized_keys)} )", param_values
+        parameterized_keys, keys_template = _parameterized_key_skeleton(
+            key.replace(".", "_"), len(values)
+        )
+        return keys_template, dict(zip(parameterized_keys, values))
 
     @staticmethod
     def _parameterize_list(
@@ -156,28 +152,82 @@ class TemplateGenerators:
         with key value pairs matching the string parameters.
         :return a tuple of the parameter string and the dictionary of parameter values
         """
-        param_values = {}
-        param_inner_keys = []
-
         if isinstance(values, str):
-            values = tuple((values,))
+            values = (values,)
+        elif not isinstance(values, (list, tuple)):
+            # Materialize generators and other one-shot iterables up front so the
+            # paths below can index and size them without exhausting anything
+            values = tuple(values)
+
+        # Fast path: non-values keys with plain scalar elements parameterize as a
+        # single list; only values keys and tuple elements (multi-column) need the
+        # per-element handling below
+        if values and not key.startswith("values") and not isinstance(values[0], tuple):
+            return TemplateGenerators._parameterize_inner_list(key, values)
 
+        param_values = {}
+        param_inner_keys = []
         for index, value in enumerate(values):
-            if isinstance(value, tuple) or key.startswith("values"):
-                (
-                    param_string,
-                    inner_param_values,
-                ) = TemplateGenerators._parameterize_inner_list(
-                    f"{key}_{str(index)}", value
-                )
-                param_values.update(inner_param_values)
-                param_inner_keys.append(param_string)
-            else:
-                return TemplateGenerators._parameterize_inner_list(key, values)
+            (
+                param_string,
+                inner_param_values,
+            ) = TemplateGenerators._parameterize_inner_list(f"{key}_{index}", value)
+            param_values.update(inner_param_values)
+            param_inner_keys.append(param_string)
 
         return ", ".join(param_inner_keys), param_values
 
 
+@functools.lru_cache(maxsize=4096)
+def _parameterized_key_skeleton(
+    clean_key: str, count: int
+) -> Tuple[Tuple[str, ...], str]:
+    """
+    Build the parameterized keys and the joined keys template for a list of the
+    given size. The same (key, size) pairs recur constantly in real workloads, so
+    the skeleton is cached and only the values need to be zipped in per call.
+    :param clean_key: the key with dots already replaced
+    :param count: the number of values in the list
+    :return: a tuple of the parameterized keys and the joined keys template
+    """
+    parameterized_keys = tuple(f"{clean_key}_{index}" for index in range(count))
+    return parameterized_keys, f"( :{', :'.join(parameterized_keys)} )"
+
+
+def _fast_in_column(
+    name: str, values: Union[str, Iterable[str]], legacy_key: str = None
+) -> Tuple[str, Optional[dict]]:
+    """
+    Specialized in_column for the overwhelmingly common case of a plain,
+    non-empty list or tuple of scalar values, skipping the key cleanup and
+    per-element branching of the general path. Anything else falls back to
+    TemplateGenerators.in_column.
+    """
+    if not (
+        isinstance(values, (list, tuple))
+        and values
+        and not isinstance(values[0], tuple)
+    ):
+        return TemplateGenerators.in_column(name, values, legacy_key)
+    key = legacy_key if legacy_key else name
+    parameterized_keys, keys_template = _parameterized_key_skeleton(
+        key.replace(".", "_"), len(values)
+    )
+    return f"{name} IN {keys_template}", dict(zip(parameterized_keys, values))
+
+
+# maps template keywords to their generators for O(1) dispatch on the query path
+_TEMPLATE_DISPATCH = {
+    "in": TemplateGenerators.in_column,
+    "not_in": TemplateGenerators.not_in_column,
+    "values": TemplateGenerators.values,
+}
+
+# get_query_data dispatches through the specialized fast paths, while get_template
+# keeps returning the public generators above
+_EXPANSION_DISPATCH = {**_TEMPLATE_DISPATCH, "in": _fast_in_column}
+
+
 class ListTemplateException(Exception):
     """
     List Template Exception
@@ -250,26 +300,30 @@ class QueryData:
         self.template_params = template_params
 
 
-def __validate_keys_clean_query(query, template_params):
-    validated_keys = []
-    for groups in re.findall(LIST_TEMPLATE_REGEX, query):
-        # check first group for the full key
-        key = f'{groups[2]}__{groups[3] if groups[3] else ""}{groups[4]}'
-        validated_keys.append(key)
-        missing_keys = []
-
-        # validate
-        if template_params is None or template_params.get(key) is None:
-            missing_keys.append(key)
-        elif key == "values" and len(template_params.get(key)) == 0:
-            missing_keys.append(key)
-
-        if len(missing_keys) > 0:
-            raise ListTemplateException(f"Missing template keys {missing_keys}")
-
-        # Clean whitespace as templates will add their own padding later on
-        query = query.replace(groups[0], groups[0].strip())
-    return query, validated_keys
+@functools.lru_cache(maxsize=1024)
+def _parse_query(
+    query: str,
+) -> Tuple[Tuple[str, ...], Tuple[Tuple[str, str, str], ...]]:
+    """
+    Parse a query into the literal chunks surrounding each list template and the
+    template keys found between them. Applications tend to issue the same small
+    set of query strings over and over with different parameter values, so the
+    parse is cached on the raw query string and the regex scan only happens the
+    first time a query is seen.
+    :param query: the SQL query, possibly containing list templates
+    :return: a tuple of the literal chunks and the parsed templates, each a
+        (keyword, column name, full key) tuple; there is always exactly one more
+        chunk than there are templates
+    """
+    # split interleaves the literal chunks with the three captures of each template,
+    # so a single C-level traversal yields the whole structure with a stride of 4
+    parts = LIST_TEMPLATE_REGEX.split(query)
+    keys = []
+    for keyword, table_name, column_name in zip(parts[1::4], parts[2::4], parts[3::4]):
+        if table_name:
+            column_name = table_name + column_name
+        keys.append((keyword, column_name, f"{keyword}__{column_name}"))
+    return tuple(parts[::4]), tuple(keys)
 
 
 def __validate_query_and_params(data: QueryData) -> None:
@@ -287,23 +341,49 @@ def get_query_data(data: QueryData) -> Tuple[str, dict]:
     """
     __validate_query_and_params(data)
 
+    query = data.query
     params = {}
-    query, validated_keys = __validate_keys_clean_query(
-        data.query, data.template_params
-    )
-
     if data.query_params:
         params.update(data.query_params)
 
-    for key in validated_keys:
-        list_template_key, column_name = tuple(key.split("__"))
-        template_to_use = TemplateGenerators.get_template(list_template_key)
+    # Queries without a single brace cannot contain templates, so the cheap
+    # containment check skips the parse (and its cache) entirely
+    if "{" not in query:
+        return query, params
+
+    template_params = data.template_params
+    literal_chunks, keys = _parse_query(query)
+    if not keys:
+        return query, params
+    if template_params is None:
+        raise ListTemplateException(f"Missing template keys {[keys[0][2]]}")
+
+    # Interleave the cached literal chunks with the expanded templates, building the
+    # final query with a single join. Lookups used on every iteration are bound to
+    # locals to keep the loop body to plain calls.
+    template_params_get = template_params.get
+    param_dicts = []
+    append_param_dict = param_dicts.append
+    query_parts = [literal_chunks[0]]
+    for (list_template_key, column_name, key), next_chunk in zip(
+        keys, literal_chunks[1:]
+    ):
+        # validate
+        template_values = template_params_get(key)
+        if template_values is None:
+            raise ListTemplateException(f"Missing template keys {[key]}")
+
+        template_to_use = _EXPANSION_DISPATCH[list_template_key]
         template_query, param_dict = template_to_use(
-            column_name, data.template_params[key], legacy_key=key
+            column_name, template_values, legacy_key=key
         )
         if param_dict:
-            params.update(param_dict)
-        query_key = "{" + key + "}"
-        query = query.replace(query_key, f" {template_query} ")
+            append_param_dict(param_dict)
+        # Templates add their own padding in place of any whitespace around the match
+        query_parts += (" ", template_query, " ", next_chunk)
+
+    # Merge the generated params in one batch after the walk
+    for param_dict in param_dicts:
+        params.update(param_dict)
 
-    return query, params
+    return "".join(query_parts), params
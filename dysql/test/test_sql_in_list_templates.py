@@ -99,6 +99,18 @@ def test_list_not_in_strings(mock_engine):
     )
 
 
+def test_list_in_leaves_literal_braces(mock_engine):
+    _query(
+        "SELECT * FROM table WHERE data = '{not_a_template}' AND {in__column_a}",
+        template_params={"in__column_a": [1, 2]},
+    )
+    _verify_query(
+        mock_engine,
+        "SELECT * FROM table WHERE data = '{not_a_template}' "
+        "AND column_a IN ( :in__column_a_0, :in__column_a_1 ) ",
+    )
+
+
 def test_list_in_handles_empty(mock_engine):
     _query(
         "SELECT * FROM table WHERE {in__column_a}", template_params={"in__column_a": []}